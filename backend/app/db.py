@@ -1,6 +1,8 @@
 """Database configuration and session management."""
 
 import os
+from sqlalchemy import Connection, event, inspect
+from sqlalchemy.pool import StaticPool
 from sqlmodel import SQLModel, create_engine, Session
 from .settings import settings
 
@@ -16,24 +18,128 @@ def _ensure_sqlite_dir(url: str) -> None:
         if dirpath:
             os.makedirs(dirpath, exist_ok=True)
 
+_is_sqlite = settings.database_url.startswith("sqlite")
+_is_sqlite_memory = _is_sqlite and settings.database_url in ("sqlite://", "sqlite:///:memory:")
+# Create the file's directory up front so the first connection can open it,
+# whether or not init_db creates the tables
 _ensure_sqlite_dir(settings.database_url)
 
-engine = create_engine(
-    settings.database_url,
-    echo=False,
-    connect_args={"check_same_thread": False} if settings.database_url.startswith("sqlite") else {},
-)
+if _is_sqlite_memory:
+    # Every new connection to :memory: is a separate, empty database;
+    # share the one connection so all sessions see the same data
+    engine = create_engine(
+        settings.database_url,
+        echo=False,
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+elif _is_sqlite:
+    engine = create_engine(
+        settings.database_url,
+        echo=False,
+        connect_args={"check_same_thread": False},
+    )
+else:
+    # Defaults (5 connections) run out well before ~100 concurrent requests
+    engine = create_engine(
+        settings.database_url,
+        echo=False,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_pre_ping=True,
+        pool_recycle=settings.db_pool_recycle,
+    )
+
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, _connection_record) -> None:
+        """Enable WAL (concurrent readers with one writer) and relaxed fsync."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
+def migrate_occurred_at_to_epoch(conn: Connection) -> None:
+    """Convert SQLite `transaction.occurred_at` from DATETIME text to epoch seconds.
+    
+    Rows written before the column became INTEGER hold ISO text, which breaks
+    serialization and sorts above every integer in range filters. Safe to run
+    repeatedly: once converted, there is nothing left to update or rebuild.
+    
+    Args:
+        conn: Connection inside the transaction to run the migration in
+    """
+    columns = {row[1]: row[2] for row in conn.exec_driver_sql('PRAGMA table_info("transaction")')}
+    if "occurred_at" not in columns:
+        return
+    conn.exec_driver_sql(
+        "UPDATE \"transaction\" SET occurred_at = CAST(strftime('%s', occurred_at) AS INTEGER) "
+        "WHERE typeof(occurred_at) = 'text'"
+    )
+    if columns["occurred_at"].upper() == "INTEGER":
+        return
+    # SQLite can't change a column's type in place: rebuild the table
+    from .models import Transaction
+    table = Transaction.__table__
+    conn.exec_driver_sql('ALTER TABLE "transaction" RENAME TO "transaction_legacy"')
+    for index in table.indexes:
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{index.name}"')
+    table.create(conn)
+    names = ", ".join(f'"{column.name}"' for column in table.columns if column.name in columns)
+    conn.exec_driver_sql(f'INSERT INTO "transaction" ({names}) SELECT {names} FROM "transaction_legacy"')
+    conn.exec_driver_sql('DROP TABLE "transaction_legacy"')
+
+# Single-column indexes superseded by composite indexes that lead with the same column
+_DROPPED_INDEXES = ("ix_category_user_id", "ix_transaction_user_id")
+
+def sync_indexes(conn: Connection) -> None:
+    """Bring indexes on existing tables in line with the models.
+    
+    `create_all` only creates indexes together with their table, so databases
+    created before an index was added or dropped never pick up the change.
+    
+    Args:
+        conn: Connection inside the transaction to run the changes in
+    """
+    from . import models  # noqa
+    existing = set(inspect(conn).get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name in existing:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    for name in _DROPPED_INDEXES:
+        conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{name}"')
 
 def init_db() -> None:
-    """Initialize database by creating all tables."""
+    """Initialize database by creating all tables.
+    
+    On SQLite, legacy `occurred_at` values are always converted and indexes on
+    existing tables synced; tables are only created when
+    `settings.auto_create_tables` is enabled.
+    """
+    if _is_sqlite:
+        with engine.begin() as conn:
+            migrate_occurred_at_to_epoch(conn)
+            sync_indexes(conn)
+    if not settings.auto_create_tables:
+        return
     from . import models  # noqa
     SQLModel.metadata.create_all(engine)
+    if _is_sqlite:
+        # Refresh planner statistics so SQLite picks the composite indexes
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
 
 def get_session():
     """Dependency function to get database session.
     
+    Objects are not expired on commit: primary keys come back from the INSERT
+    and defaults are set in Python, so reloading them would be a wasted query.
+    
     Yields:
         Database session
     """
-    with Session(engine) as session:
+    with Session(engine, expire_on_commit=False) as session:
         yield session
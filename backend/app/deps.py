@@ -2,11 +2,15 @@ from fastapi import Header, HTTPException
 from .settings import settings
 from .telegram_auth import verify_init_data, TelegramUser
 
-def get_current_user(
+async def get_current_user(
     x_tg_init_data: str | None = Header(default=None),
     x_tg_user_id: str | None = Header(default=None)
 ) -> TelegramUser:
-    """Get current user from Telegram initData or simple bot user ID."""
+    """Get current user from Telegram initData or simple bot user ID.
+    
+    Declared async because it never blocks (signature checks are cached), so
+    FastAPI runs it on the event loop instead of a threadpool worker.
+    """
     
     # Try proper initData first (from web app)
     if x_tg_init_data:
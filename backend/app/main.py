@@ -1,18 +1,25 @@
 """FastAPI application main module."""
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+from typing import Any
 
+import orjson
+from cachetools import LRUCache
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from sqlalchemy import and_, case
+from sqlalchemy.orm import raiseload
 from sqlmodel import Session, select, func
-
-from backend.app.telegram_webhook import router as telegram_router
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import Receive, Scope, Send
 
 from .settings import settings
 from .db import init_db, get_session
 from .deps import get_current_user
-from .models import User, Category, Transaction
+from .constants import MONTHS_DAYS, WEEKS_DAYS
+from .models import User, Category, Transaction, epoch_now, to_epoch
 from .schemas import (
     MeOut,
     CategoryCreate,
@@ -28,12 +35,26 @@ from .middleware import (
     RequestLoggingMiddleware,
     SecurityHeadersMiddleware,
 )
+from .telegram_webhook import router as telegram_router, start_client, close_client
 
-# ✅ Create app FIRST
-app = FastAPI(title=settings.app_name)
 
-# ✅ Include Telegram router AFTER app is created
-app.include_router(telegram_router)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Initialize the database and the shared Telegram client for the app's lifetime."""
+    init_db()
+    await start_client()
+    try:
+        yield
+    finally:
+        await close_client()
+
+
+# ✅ Create app FIRST
+app = FastAPI(
+    title=settings.app_name,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
+)
 
 # CORS Middleware
 origins = [o.strip() for o in settings.cors_origins.split(",") if o.strip()]
@@ -45,21 +66,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Real gzip for JSON list responses (categories, transactions)
+app.add_middleware(GZipMiddleware, minimum_size=512)
+
 # Custom Middlewares (order matters - they execute bottom to top)
 app.add_middleware(SecurityHeadersMiddleware)
 app.add_middleware(RequestLoggingMiddleware, log_request_body=False)
 app.add_middleware(RateLimitMiddleware, calls=200, period=60)
 
+# ✅ Include Telegram router AFTER app and middleware are set up
+app.include_router(telegram_router)
 
-@app.on_event("startup")
-def _startup():
-    """Initialize database on application startup."""
-    init_db()
+
+_DAY_SECONDS = 86_400
+_WEEK_SECONDS = WEEKS_DAYS * _DAY_SECONDS
+_MONTH_SECONDS = MONTHS_DAYS * _DAY_SECONDS
+
+# tg_user_id -> User.id, so warm requests resolve the user by primary key
+_user_cache: LRUCache = LRUCache(maxsize=10_000)
+# User ids whose default categories have already been ensured; bounded like
+# _user_cache, and an evicted user just re-runs the idempotent ensure_seed
+_seeded: LRUCache = LRUCache(maxsize=10_000)
 
 
 def _get_or_create_user(session: Session, tg):
     """Get or create user from Telegram data."""
-    user = session.exec(select(User).where(User.tg_user_id == tg.id)).first()
+    user = None
+    user_id = _user_cache.get(tg.id)
+    if user_id is not None:
+        user = session.get(User, user_id)
+        if user is not None and user.tg_user_id != tg.id:
+            user = None
+    if user is None:
+        user = session.exec(select(User).where(User.tg_user_id == tg.id)).first()
+
     if not user:
         user = User(
             tg_user_id=tg.id,
@@ -70,8 +110,12 @@ def _get_or_create_user(session: Session, tg):
         )
         session.add(user)
         session.commit()
-        session.refresh(user)
-    else:
+    elif (
+        user.first_name != tg.first_name
+        or user.last_name != tg.last_name
+        or user.username != tg.username
+        or user.language_code != tg.language_code
+    ):
         user.first_name = tg.first_name
         user.last_name = tg.last_name
         user.username = tg.username
@@ -79,27 +123,62 @@ def _get_or_create_user(session: Session, tg):
         session.add(user)
         session.commit()
 
-    ensure_seed(session, user.id)
+    _user_cache[tg.id] = user.id
+    # get() rather than `in`, so a hit also refreshes the entry's recency
+    if not _seeded.get(user.id):
+        ensure_seed(session, user.id)
+        _seeded[user.id] = True
     return user
 
 
 @app.get("/health")
-def health():
+async def health():
     """Health check endpoint."""
     return {"ok": True, "app": settings.app_name}
 
 
+_HEALTH_BODY = orjson.dumps({"ok": True, "app": settings.app_name})
+_HEALTH_START = {
+    "type": "http.response.start",
+    "status": 200,
+    "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(_HEALTH_BODY)).encode()),
+    ],
+}
+_HEALTH_RESPONSE_BODY = {"type": "http.response.body", "body": _HEALTH_BODY}
+
+
+async def asgi_app(scope: Scope, receive: Receive, send: Send) -> None:
+    """Server entry point: answers /health before the middleware stack and router.
+
+    Load balancers poll it constantly, so it is written straight to `send`;
+    everything else (including lifespan events) goes to `app`.
+    """
+    if scope["type"] == "http" and scope["path"] == "/health":
+        await send(_HEALTH_START)
+        await send(_HEALTH_RESPONSE_BODY)
+        return
+    await app(scope, receive, send)
+
+
+def _json_response(content: Any, status_code: int = 200) -> Response:
+    """Serialize trusted output dicts with orjson, skipping response_model validation.
+
+    Routes keep `response_model` for the OpenAPI schema; OPT_UTC_Z keeps UTC
+    datetimes in the same `...Z` form pydantic produces.
+    """
+    return Response(
+        orjson.dumps(content, option=orjson.OPT_UTC_Z),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
 @app.get("/api/me", response_model=MeOut)
 def me(tg=Depends(get_current_user), session: Session = Depends(get_session)):
     """Get current authenticated user information."""
-    user = _get_or_create_user(session, tg)
-    return MeOut(
-        tg_user_id=user.tg_user_id,
-        first_name=user.first_name,
-        last_name=user.last_name,
-        username=user.username,
-        language_code=user.language_code,
-    )
+    return _json_response(MeOut.dump_row(_get_or_create_user(session, tg)))
 
 
 @app.get("/api/categories", response_model=list[CategoryOut])
@@ -111,17 +190,7 @@ def list_categories(tg=Depends(get_current_user), session: Session = Depends(get
         .where(Category.user_id == user.id)
         .order_by(Category.kind, Category.name)
     ).all()
-    return [
-        CategoryOut(
-            id=c.id,
-            name=c.name,
-            kind=c.kind,
-            color=c.color,
-            icon=c.icon,
-            is_active=c.is_active
-        )
-        for c in items
-    ]
+    return _json_response([CategoryOut.dump_row(c) for c in items])
 
 
 @app.post("/api/categories", response_model=CategoryOut, status_code=status.HTTP_201_CREATED)
@@ -142,15 +211,7 @@ def create_category(
     )
     session.add(c)
     session.commit()
-    session.refresh(c)
-    return CategoryOut(
-        id=c.id,
-        name=c.name,
-        kind=c.kind,
-        color=c.color,
-        icon=c.icon,
-        is_active=c.is_active
-    )
+    return _json_response(CategoryOut.dump_row(c), status.HTTP_201_CREATED)
 
 
 @app.patch("/api/categories/{category_id}", response_model=CategoryOut)
@@ -172,14 +233,7 @@ def update_category(
     session.add(c)
     session.commit()
     session.refresh(c)
-    return CategoryOut(
-        id=c.id,
-        name=c.name,
-        kind=c.kind,
-        color=c.color,
-        icon=c.icon,
-        is_active=c.is_active
-    )
+    return _json_response(CategoryOut.dump_row(c))
 
 
 @app.delete("/api/categories/{category_id}")
@@ -206,23 +260,16 @@ def list_transactions(
 ):
     """List transactions for the authenticated user."""
     user = _get_or_create_user(session, tg)
+    # TxOut only needs column data; raiseload turns any relationship access
+    # (a per-row lazy load, i.e. an N+1) into an error instead of extra queries
     items = session.exec(
         select(Transaction)
+        .options(raiseload("*"))
         .where(Transaction.user_id == user.id)
         .order_by(Transaction.occurred_at.desc())
         .limit(min(limit, 200))
     ).all()
-    return [
-        TxOut(
-            id=t.id,
-            type=t.type,
-            amount=t.amount,
-            note=t.note,
-            occurred_at=t.occurred_at,
-            category_id=t.category_id
-        )
-        for t in items
-    ]
+    return _json_response([TxOut.dump_row(t) for t in items])
 
 
 @app.post("/api/transactions", response_model=TxOut)
@@ -233,7 +280,7 @@ def create_transaction(
 ):
     """Create a new transaction."""
     user = _get_or_create_user(session, tg)
-    occurred = payload.occurred_at or datetime.utcnow()
+    occurred = to_epoch(payload.occurred_at) if payload.occurred_at else epoch_now()
     t = Transaction(
         user_id=user.id,
         category_id=payload.category_id,
@@ -244,15 +291,7 @@ def create_transaction(
     )
     session.add(t)
     session.commit()
-    session.refresh(t)
-    return TxOut(
-        id=t.id,
-        type=t.type,
-        amount=t.amount,
-        note=t.note,
-        occurred_at=t.occurred_at,
-        category_id=t.category_id
-    )
+    return _json_response(TxOut.dump_row(t))
 
 
 @app.delete("/api/transactions/{tx_id}")
@@ -276,37 +315,35 @@ def stats(tg=Depends(get_current_user), session: Session = Depends(get_session))
     """Get statistics for the authenticated user."""
     user = _get_or_create_user(session, tg)
 
-    now = datetime.utcnow()
-    week_start = now - timedelta(days=7)
-    month_start = now - timedelta(days=30)
+    now = epoch_now()
+    week_start = now - _WEEK_SECONDS
+    month_start = now - _MONTH_SECONDS
 
-    def sum_type(since: datetime, typ: str) -> int:
-        q = select(func.coalesce(func.sum(Transaction.amount), 0)).where(
-            Transaction.user_id == user.id,
-            Transaction.type == typ,
-            Transaction.occurred_at >= since,
+    def sum_where(*conditions):
+        """Conditional SUM(amount) so every total comes from the same scan."""
+        return func.coalesce(
+            func.sum(case((and_(*conditions), Transaction.amount), else_=0)), 0
         )
-        return int(session.exec(q).one())
-
-    week_spent = sum_type(week_start, "expense")
-    week_income = sum_type(week_start, "income")
-    month_spent = sum_type(month_start, "expense")
-    month_income = sum_type(month_start, "income")
-
-    inc_all = int(session.exec(
-        select(func.coalesce(func.sum(Transaction.amount), 0))
-        .where(Transaction.user_id == user.id, Transaction.type == "income")
-    ).one())
-    exp_all = int(session.exec(
-        select(func.coalesce(func.sum(Transaction.amount), 0))
-        .where(Transaction.user_id == user.id, Transaction.type == "expense")
-    ).one())
-    balance = inc_all - exp_all
-
-    return StatsOut(
-        balance=balance,
-        week_spent=week_spent,
-        week_income=week_income,
-        month_spent=month_spent,
-        month_income=month_income,
-    )
+
+    is_income = Transaction.type == "income"
+    is_expense = Transaction.type == "expense"
+
+    row = session.exec(
+        select(
+            sum_where(is_expense, Transaction.occurred_at >= week_start).label("week_spent"),
+            sum_where(is_income, Transaction.occurred_at >= week_start).label("week_income"),
+            sum_where(is_expense, Transaction.occurred_at >= month_start).label("month_spent"),
+            sum_where(is_income, Transaction.occurred_at >= month_start).label("month_income"),
+            sum_where(is_income).label("inc_all"),
+            sum_where(is_expense).label("exp_all"),
+        ).where(Transaction.user_id == user.id)
+    ).one()
+
+    # Same shape as StatsOut
+    return _json_response({
+        "balance": int(row.inc_all) - int(row.exp_all),
+        "week_spent": int(row.week_spent),
+        "week_income": int(row.week_income),
+        "month_spent": int(row.month_spent),
+        "month_income": int(row.month_income),
+    })
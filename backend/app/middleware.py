@@ -4,22 +4,75 @@ Comprehensive middleware for rate limiting, logging, and security.
 Copy this to: backend/app/middleware.py
 """
 
-from collections import defaultdict
-from datetime import datetime, timedelta
-from typing import Dict, List
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+import heapq
 import time
 import uuid
 import logging
 import json
+import re
+import urllib.parse
 
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response, JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 logger = logging.getLogger(__name__)
 
+# Telegram user id inside percent-encoded initData (user=%7B%22id%22%3A123...)
+_ENCODED_USER_ID_RE = re.compile(rb'user=[^&]*?%22id%22%3A(\d+)')
+# Fallback for initData that is not (or differently) percent-encoded
+_DECODED_USER_ID_RE = re.compile(rb'user=[^&]*?"id"\s*:\s*(\d+)')
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+
+# Constant security headers, encoded once and appended as-is to every response
+_STATIC_SECURITY_HEADERS: Tuple[Tuple[bytes, bytes], ...] = (
+    # Content Security Policy
+    (
+        b"content-security-policy",
+        b"default-src 'self'; "
+        b"script-src 'self' 'unsafe-inline' 'unsafe-eval' https://telegram.org; "
+        b"style-src 'self' 'unsafe-inline'; "
+        b"img-src 'self' data: https: blob:; "
+        b"font-src 'self' data:; "
+        b"connect-src 'self' https://api.telegram.org; "
+        b"frame-ancestors 'none'; "
+        b"base-uri 'self'; "
+        b"form-action 'self';"
+    ),
+    # Prevent clickjacking
+    (b"x-frame-options", b"DENY"),
+    # Prevent MIME type sniffing
+    (b"x-content-type-options", b"nosniff"),
+    # XSS Protection (legacy but still useful)
+    (b"x-xss-protection", b"1; mode=block"),
+    # Force HTTPS
+    (b"strict-transport-security", b"max-age=31536000; includeSubDomains; preload"),
+    # Referrer policy
+    (b"referrer-policy", b"strict-origin-when-cross-origin"),
+    # Permissions policy (formerly Feature-Policy)
+    (
+        b"permissions-policy",
+        b"geolocation=(), "
+        b"microphone=(), "
+        b"camera=(), "
+        b"payment=(), "
+        b"usb=(), "
+        b"magnetometer=(), "
+        b"gyroscope=(), "
+        b"accelerometer=()"
+    ),
+)
+
+
+def _get_header(scope: Scope, name: bytes) -> Optional[bytes]:
+    """Return the first raw value of a (lowercase) header from an ASGI scope"""
+    for key, value in scope["headers"]:
+        if key == name:
+            return value
+    return None
+
+
+class RateLimitMiddleware:
     """
     Rate limit requests per user to prevent abuse.
     
@@ -28,208 +81,242 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         calls: int = 100,
         period: int = 60,
         exclude_paths: List[str] = None
     ):
-        super().__init__(app)
+        self.app = app
         self.calls = calls
         self.period = period
-        self.exclude_paths = exclude_paths or ["/health", "/metrics", "/docs", "/redoc"]
-        self.requests: Dict[str, List[datetime]] = defaultdict(list)
+        self.exclude_paths = tuple(exclude_paths or ["/health", "/metrics", "/docs", "/redoc"])
+        # Per-user ring buffer of monotonic request timestamps
+        # Keyed by raw bytes identifiers so lookups never need to decode
+        self.requests: Dict[bytes, Deque[float]] = defaultdict(lambda: deque(maxlen=self.calls))
         self._cleanup_interval = 300  # Cleanup old data every 5 minutes
-        self._last_cleanup = datetime.now()
+        self._last_cleanup = time.monotonic()
+        # Last accepted request per user, plus a min-heap of (last_seen, user)
+        # holding at most one entry per user, ordered by when it may expire
+        self._last_seen: Dict[bytes, float] = {}
+        self._expiry_heap: List[Tuple[float, bytes]] = []
+        self._limit_header = str(calls).encode()
+        self._retry_after_header = str(period).encode()
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
         # Skip rate limiting for excluded paths
-        if any(request.url.path.startswith(path) for path in self.exclude_paths):
-            return await call_next(request)
+        path = scope["path"]
+        if path.startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
         
         # Get user identifier
-        user_id = self._get_user_identifier(request)
+        user_id = self._get_user_identifier(scope)
         
         # Check rate limit
-        now = datetime.now()
-        cutoff = now - timedelta(seconds=self.period)
+        now = time.monotonic()
+        cutoff = now - self.period
         
-        # Clean old requests for this user
-        self.requests[user_id] = [
-            req_time for req_time in self.requests[user_id]
-            if req_time > cutoff
-        ]
+        # Drop expired requests for this user (oldest first)
+        timestamps = self.requests[user_id]
+        while timestamps and timestamps[0] <= cutoff:
+            timestamps.popleft()
         
         # Check if limit exceeded
-        if len(self.requests[user_id]) >= self.calls:
+        if len(timestamps) >= self.calls:
             logger.warning(
-                f"Rate limit exceeded for user {user_id}",
+                f"Rate limit exceeded for user {user_id.decode('latin-1')}",
                 extra={
-                    "user_id": user_id,
-                    "path": request.url.path,
-                    "requests_count": len(self.requests[user_id])
+                    "user_id": user_id.decode("latin-1"),
+                    "path": path,
+                    "requests_count": len(timestamps)
                 }
             )
             
-            return JSONResponse(
-                status_code=429,
-                content={
-                    "error": "Too many requests. Please try again later.",
-                    "retry_after": self.period
-                },
-                headers={
-                    "Retry-After": str(self.period),
-                    "X-RateLimit-Limit": str(self.calls),
-                    "X-RateLimit-Remaining": "0",
-                    "X-RateLimit-Reset": str(int((cutoff + timedelta(seconds=self.period)).timestamp()))
-                }
-            )
+            # The window frees up once the oldest request expires
+            reset = int(time.time() + (timestamps[0] - cutoff))
+            await self._send_rate_limited(send, reset)
+            return
         
         # Add current request
-        self.requests[user_id].append(now)
+        timestamps.append(now)
+        if user_id not in self._last_seen:
+            heapq.heappush(self._expiry_heap, (now, user_id))
+        self._last_seen[user_id] = now
         
         # Periodic cleanup
-        if (now - self._last_cleanup).seconds > self._cleanup_interval:
+        if now - self._last_cleanup > self._cleanup_interval:
             self._cleanup_old_data()
             self._last_cleanup = now
         
-        # Process request
-        response = await call_next(request)
+        reset_header = str(int(time.time()) + self.period).encode()
+        
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # Add rate limit headers
+                headers = list(message.get("headers", []))
+                headers.append((b"x-ratelimit-limit", self._limit_header))
+                headers.append((
+                    b"x-ratelimit-remaining",
+                    str(max(0, self.calls - len(timestamps))).encode(),
+                ))
+                headers.append((b"x-ratelimit-reset", reset_header))
+                message["headers"] = headers
+            await send(message)
         
-        # Add rate limit headers
-        response.headers["X-RateLimit-Limit"] = str(self.calls)
-        response.headers["X-RateLimit-Remaining"] = str(
-            max(0, self.calls - len(self.requests[user_id]))
-        )
-        response.headers["X-RateLimit-Reset"] = str(
-            int((now + timedelta(seconds=self.period)).timestamp())
-        )
-        
-        return response
+        # Process request
+        await self.app(scope, receive, send_wrapper)
     
-    def _get_user_identifier(self, request: Request) -> str:
+    async def _send_rate_limited(self, send: Send, reset: int) -> None:
+        """Write a 429 response directly to the ASGI send channel"""
+        body = json.dumps({
+            "error": "Too many requests. Please try again later.",
+            "retry_after": self.period
+        }).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", self._retry_after_header),
+                (b"x-ratelimit-limit", self._limit_header),
+                (b"x-ratelimit-remaining", b"0"),
+                (b"x-ratelimit-reset", str(reset).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+    
+    def _get_user_identifier(self, scope: Scope) -> bytes:
         """Extract user identifier from request"""
         # Try to get from Telegram initData
-        init_data = request.headers.get("x-tg-init-data", "")
+        init_data = _get_header(scope, b"x-tg-init-data")
         if init_data:
             user_id = self._extract_user_id_from_init_data(init_data)
             if user_id:
-                return f"user:{user_id}"
+                # Unverified (no signature check here): only a rate limit key,
+                # never exposed to handlers as the request's user
+                return b"user:" + user_id
         
         # Fallback to IP address
-        forwarded_for = request.headers.get("x-forwarded-for")
+        forwarded_for = _get_header(scope, b"x-forwarded-for")
         if forwarded_for:
-            return f"ip:{forwarded_for.split(',')[0]}"
+            return b"ip:" + forwarded_for.partition(b",")[0].strip()
         
-        client_host = request.client.host if request.client else "unknown"
-        return f"ip:{client_host}"
+        client = scope.get("client")
+        client_host = client[0] if client else "unknown"
+        return b"ip:" + client_host.encode("latin-1")
     
-    def _extract_user_id_from_init_data(self, init_data: str) -> str:
-        """Extract user ID from Telegram initData"""
-        try:
-            import urllib.parse
-            data = dict(urllib.parse.parse_qsl(init_data))
-            user_json = data.get("user", "{}")
-            user = json.loads(user_json)
-            return str(user.get("id", ""))
-        except Exception:
-            return ""
+    def _extract_user_id_from_init_data(self, init_data: bytes) -> bytes:
+        """Extract user ID from raw Telegram initData without parsing it"""
+        match = _ENCODED_USER_ID_RE.search(init_data)
+        if match is None:
+            match = _DECODED_USER_ID_RE.search(urllib.parse.unquote_to_bytes(init_data))
+        return match.group(1) if match else b""
     
     def _cleanup_old_data(self):
         """Remove data for users who haven't made requests recently"""
-        cutoff = datetime.now() - timedelta(seconds=self.period * 2)
-        users_to_remove = []
-        
-        for user_id, requests in self.requests.items():
-            if not requests or all(req_time < cutoff for req_time in requests):
-                users_to_remove.append(user_id)
-        
-        for user_id in users_to_remove:
-            del self.requests[user_id]
-        
-        if users_to_remove:
-            logger.debug(f"Cleaned up rate limit data for {len(users_to_remove)} users")
+        cutoff = time.monotonic() - self.period * 2
+        removed = 0
+        
+        # Only heap entries older than the cutoff are visited; users seen since
+        # they were pushed are re-queued with their newer timestamp
+        heap = self._expiry_heap
+        while heap and heap[0][0] < cutoff:
+            _, user_id = heapq.heappop(heap)
+            last_seen = self._last_seen[user_id]
+            if last_seen < cutoff:
+                del self._last_seen[user_id]
+                self.requests.pop(user_id, None)
+                removed += 1
+            else:
+                heapq.heappush(heap, (last_seen, user_id))
+        
+        if removed:
+            logger.debug(f"Cleaned up rate limit data for {removed} users")
 
 
-class RequestLoggingMiddleware(BaseHTTPMiddleware):
+class RequestLoggingMiddleware:
     """
     Log all requests with timing, user info, and response status.
     """
     
-    def __init__(self, app, log_request_body: bool = False):
-        super().__init__(app)
+    def __init__(self, app: ASGIApp, log_request_body: bool = False):
+        self.app = app
         self.log_request_body = log_request_body
     
-    async def dispatch(self, request: Request, call_next):
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
         # Generate unique request ID
-        request_id = str(uuid.uuid4())
-        request.state.request_id = request_id
+        request_id = uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
         
         # Start timing
-        start_time = time.time()
+        start_time = time.perf_counter()
+        
+        method = scope["method"]
+        path = scope["path"]
+        client = scope.get("client")
+        user_agent = _get_header(scope, b"user-agent")
         
         # Log request
         logger.info(
-            f"Request started: {request.method} {request.url.path}",
+            f"Request started: {method} {path}",
             extra={
                 "request_id": request_id,
-                "method": request.method,
-                "path": request.url.path,
-                "query_params": str(request.query_params),
-                "client_host": request.client.host if request.client else None,
-                "user_agent": request.headers.get("user-agent"),
+                "method": method,
+                "path": path,
+                "query_params": scope.get("query_string", b"").decode("latin-1"),
+                "client_host": client[0] if client else None,
+                "user_agent": user_agent.decode("latin-1") if user_agent else None,
             }
         )
         
-        # Log request body if enabled (be careful with sensitive data!)
-        if self.log_request_body and request.method in ["POST", "PUT", "PATCH"]:
-            try:
-                body = await request.body()
-                # Don't log if body is too large (> 1KB)
-                if len(body) < 1024:
-                    logger.debug(
-                        f"Request body: {body.decode('utf-8')}",
-                        extra={"request_id": request_id}
-                    )
-            except Exception as e:
-                logger.warning(f"Failed to log request body: {str(e)}")
+        # Tee the request body if enabled (be careful with sensitive data!);
+        # otherwise `receive` is passed through untouched
+        body_chunks: Optional[List[bytes]] = None
+        if self.log_request_body and method in ("POST", "PUT", "PATCH"):
+            body_chunks = []
+        
+        async def receive_wrapper() -> Message:
+            message = await receive()
+            if message["type"] == "http.request":
+                body_chunks.append(message.get("body", b""))
+            return message
+        
+        status_code = 500
+        
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                # Add request ID to response headers
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode()))
+                message["headers"] = headers
+            await send(message)
         
         try:
             # Process request
-            response = await call_next(request)
-            
-            # Calculate duration
-            duration = time.time() - start_time
-            
-            # Log successful response
-            logger.info(
-                f"Request completed: {request.method} {request.url.path} "
-                f"[{response.status_code}] in {duration:.2f}s",
-                extra={
-                    "request_id": request_id,
-                    "method": request.method,
-                    "path": request.url.path,
-                    "status_code": response.status_code,
-                    "duration": duration,
-                }
-            )
-            
-            # Add request ID to response headers
-            response.headers["X-Request-ID"] = request_id
-            
-            return response
-            
+            await self.app(scope, receive_wrapper if body_chunks is not None else receive, send_wrapper)
         except Exception as e:
             # Calculate duration
-            duration = time.time() - start_time
+            duration = time.perf_counter() - start_time
             
             # Log error
             logger.error(
-                f"Request failed: {request.method} {request.url.path} "
+                f"Request failed: {method} {path} "
                 f"in {duration:.2f}s - {str(e)}",
                 extra={
                     "request_id": request_id,
-                    "method": request.method,
-                    "path": request.url.path,
+                    "method": method,
+                    "path": path,
                     "duration": duration,
                     "error": str(e),
                 },
@@ -237,129 +324,57 @@ class RequestLoggingMiddleware(BaseHTTPMiddleware):
             )
             
             raise
-
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    """
-    Add security headers to all responses.
-    """
-    
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
         
-        # Content Security Policy
-        response.headers["Content-Security-Policy"] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline' 'unsafe-eval' https://telegram.org; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data: https: blob:; "
-            "font-src 'self' data:; "
-            "connect-src 'self' https://api.telegram.org; "
-            "frame-ancestors 'none'; "
-            "base-uri 'self'; "
-            "form-action 'self';"
-        )
-        
-        # Prevent clickjacking
-        response.headers["X-Frame-Options"] = "DENY"
-        
-        # Prevent MIME type sniffing
-        response.headers["X-Content-Type-Options"] = "nosniff"
+        # Calculate duration
+        duration = time.perf_counter() - start_time
         
-        # XSS Protection (legacy but still useful)
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        
-        # Force HTTPS
-        response.headers["Strict-Transport-Security"] = (
-            "max-age=31536000; includeSubDomains; preload"
-        )
-        
-        # Referrer policy
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-        
-        # Permissions policy (formerly Feature-Policy)
-        response.headers["Permissions-Policy"] = (
-            "geolocation=(), "
-            "microphone=(), "
-            "camera=(), "
-            "payment=(), "
-            "usb=(), "
-            "magnetometer=(), "
-            "gyroscope=(), "
-            "accelerometer=()"
+        # Log successful response
+        logger.info(
+            f"Request completed: {method} {path} "
+            f"[{status_code}] in {duration:.2f}s",
+            extra={
+                "request_id": request_id,
+                "method": method,
+                "path": path,
+                "status_code": status_code,
+                "duration": duration,
+            }
         )
         
-        return response
+        if body_chunks is not None:
+            body = b"".join(body_chunks)
+            # Don't log if body is too large (> 1KB)
+            if len(body) < 1024:
+                try:
+                    logger.debug(
+                        f"Request body: {body.decode('utf-8')}",
+                        extra={"request_id": request_id}
+                    )
+                except Exception as e:
+                    logger.warning(f"Failed to log request body: {str(e)}")
 
 
-class CORSMiddleware(BaseHTTPMiddleware):
+class SecurityHeadersMiddleware:
     """
-    Custom CORS middleware with additional controls.
+    Add security headers to all responses.
     """
     
-    def __init__(
-        self,
-        app,
-        allow_origins: List[str],
-        allow_methods: List[str] = None,
-        allow_headers: List[str] = None,
-        max_age: int = 600,
-    ):
-        super().__init__(app)
-        self.allow_origins = allow_origins
-        self.allow_methods = allow_methods or ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"]
-        self.allow_headers = allow_headers or ["*"]
-        self.max_age = max_age
-    
-    async def dispatch(self, request: Request, call_next):
-        origin = request.headers.get("origin")
-        
-        # Handle preflight requests
-        if request.method == "OPTIONS":
-            if origin in self.allow_origins or "*" in self.allow_origins:
-                return Response(
-                    status_code=200,
-                    headers={
-                        "Access-Control-Allow-Origin": origin or "*",
-                        "Access-Control-Allow-Methods": ", ".join(self.allow_methods),
-                        "Access-Control-Allow-Headers": ", ".join(self.allow_headers),
-                        "Access-Control-Max-Age": str(self.max_age),
-                        "Access-Control-Allow-Credentials": "true",
-                    }
-                )
-        
-        # Process request
-        response = await call_next(request)
-        
-        # Add CORS headers
-        if origin in self.allow_origins or "*" in self.allow_origins:
-            response.headers["Access-Control-Allow-Origin"] = origin or "*"
-            response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Expose-Headers"] = "X-Request-ID"
-        
-        return response
-
-
-class CompressionMiddleware(BaseHTTPMiddleware):
-    """
-    Compress responses with gzip if client supports it.
-    Note: In production, use nginx or CDN for compression.
-    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
     
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        
-        # Check if client accepts gzip
-        accept_encoding = request.headers.get("accept-encoding", "")
-        
-        if "gzip" in accept_encoding and response.status_code < 300:
-            # Only compress text responses
-            content_type = response.headers.get("content-type", "")
-            if any(t in content_type for t in ["text/", "application/json", "application/javascript"]):
-                # Add compression hint
-                response.headers["Vary"] = "Accept-Encoding"
-        
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.extend(_STATIC_SECURITY_HEADERS)
+                message["headers"] = headers
+            await send(message)
+        
+        await self.app(scope, receive, send_wrapper)
 
 
 # Usage in main.py:
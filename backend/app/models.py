@@ -1,8 +1,22 @@
-from __future__ import annotations
-from datetime import datetime
+import calendar
+import time
+from datetime import datetime, timezone
 from typing import Optional
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 
+def utcnow() -> datetime:
+    """Naive UTC timestamp, as stored in DATETIME columns (replaces deprecated utcnow())."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def epoch_now() -> int:
+    """Current time as integer epoch seconds, as stored in Transaction.occurred_at."""
+    return int(time.time())
+
+def to_epoch(dt: datetime) -> int:
+    """Epoch seconds for a datetime; naive values are taken to be UTC."""
+    return calendar.timegm(dt.utctimetuple())
+
 class User(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     tg_user_id: int = Field(index=True, unique=True)
@@ -10,31 +24,45 @@ class User(SQLModel, table=True):
     last_name: str = ""
     username: str = ""
     language_code: str = ""
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
 
     categories: list["Category"] = Relationship(back_populates="user")
     transactions: list["Transaction"] = Relationship(back_populates="user")
 
 class Category(SQLModel, table=True):
+    __table_args__ = (
+        # Serves the per-user listing ordered by kind, name
+        Index("ix_cat_user_kind_name", "user_id", "kind", "name"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id", index=True)
+    user_id: int = Field(foreign_key="user.id")
     name: str = Field(index=True)
     kind: str = Field(default="expense")  # expense | income | debt
     color: str = Field(default="#22d3ee")
     icon: str = Field(default="tag")
     is_active: bool = Field(default=True)
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: datetime = Field(default_factory=utcnow)
 
     user: Optional[User] = Relationship(back_populates="categories")
 
 class Transaction(SQLModel, table=True):
+    __table_args__ = (
+        # Serves the per-user listing ordered by occurred_at DESC (integer sort)
+        Index("ix_tx_user_occurred", "user_id", "occurred_at"),
+        # Covers the per-type date-range aggregation in /api/stats
+        Index("ix_tx_user_type_occurred", "user_id", "type", "occurred_at"),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: int = Field(foreign_key="user.id", index=True)
+    user_id: int = Field(foreign_key="user.id")
     category_id: Optional[int] = Field(default=None, foreign_key="category.id", index=True)
 
     type: str = Field(default="expense")  # expense | income
     amount: int
     note: str = ""
-    occurred_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    # Epoch seconds (UTC): INTEGER compares and sorts natively in SQLite
+    occurred_at: int = Field(default_factory=epoch_now, index=True)
 
     user: Optional[User] = Relationship(back_populates="transactions")
+    category: Optional[Category] = Relationship()
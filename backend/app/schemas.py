@@ -6,11 +6,42 @@ Copy this to: backend/app/schemas.py (replace existing)
 
 from __future__ import annotations
 from pydantic import BaseModel, Field, field_validator, ConfigDict
-from datetime import datetime, timedelta
-from typing import Optional, Literal
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Literal
 import re
 
 
+# Patterns used by the validators below, compiled once at import
+_WS_RE = re.compile(r'\s+')
+_SPACES_RE = re.compile(r' +')
+_NL_RE = re.compile(r'\n{3,}')
+_ICON_RE = re.compile(r'^[a-z0-9_-]+$')
+_SEARCH_STRIP_RE = re.compile(r'[<>\'";]')
+
+_HEX_DIGITS = frozenset('0123456789ABCDEFabcdef')
+
+# Allowed window for transaction dates (1 day of grace for timezone skew)
+_FUTURE_MARGIN = timedelta(days=1)
+_PAST_MARGIN = timedelta(days=365 * 10)
+
+# ASCII control characters except tab and newline, for str.translate
+_ASCII_CONTROL_TABLE = dict.fromkeys([*range(32), 127])
+del _ASCII_CONTROL_TABLE[ord('\t')], _ASCII_CONTROL_TABLE[ord('\n')]
+
+# Blocklists scanned in a single pass each instead of one `in` check per pattern
+_SQL_PATTERNS = (
+    'drop ', 'delete ', 'insert ', 'update ', 'select ',
+    '--', ';', '/*', '*/', 'xp_', 'sp_', 'exec'
+)
+_XSS_PATTERNS = ('<script', 'javascript:', 'onerror=', 'onclick=')
+_NAME_BLOCKLIST_RE = re.compile(
+    '|'.join(map(re.escape, _SQL_PATTERNS + _XSS_PATTERNS)), re.IGNORECASE
+)
+_NOTE_BLOCKLIST_RE = re.compile(
+    '|'.join(map(re.escape, _XSS_PATTERNS + ('onload=',))), re.IGNORECASE
+)
+
+
 class MeOut(BaseModel):
     """User information output"""
     tg_user_id: int
@@ -19,84 +50,92 @@ class MeOut(BaseModel):
     username: str = ""
     language_code: str = ""
     
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
+    @staticmethod
+    def dump_row(u) -> Dict[str, Any]:
+        """Response dict for a trusted User row, built without pydantic"""
+        return {
+            "tg_user_id": u.tg_user_id,
+            "first_name": u.first_name,
+            "last_name": u.last_name,
+            "username": u.username,
+            "language_code": u.language_code,
+        }
+
+
+# Category field validators, shared by CategoryCreate and CategoryUpdate
+# (None means "not provided" on updates and is passed through)
+def _validate_category_name(v: Optional[str]) -> Optional[str]:
+    """Validate and sanitize category name"""
+    if v is None:
+        return v
+    
+    # Strip whitespace
+    v = v.strip()
+    
+    if not v:
+        raise ValueError("Category name cannot be empty")
+    
+    # Remove multiple consecutive spaces
+    v = _WS_RE.sub(' ', v)
+    
+    # Check for potential SQL injection and XSS patterns
+    m = _NAME_BLOCKLIST_RE.search(v)
+    if m:
+        raise ValueError(f"Invalid characters in category name: '{m.group().lower()}'")
+    
+    return v
+
+
+def _validate_category_icon(v: Optional[str]) -> Optional[str]:
+    """Validate icon name"""
+    if v is None:
+        return v
+    
+    # Only allow alphanumeric, dash, and underscore
+    v = v.lower()
+    if not _ICON_RE.match(v):
+        raise ValueError("Icon name must contain only letters, numbers, dashes, and underscores")
+    
+    return v
+
+
+def _validate_category_color(v: Optional[str]) -> Optional[str]:
+    """Validate and normalize color"""
+    if v is None:
+        return v
+    
+    # '#' followed by exactly six hex digits
+    if len(v) != 7 or v[0] != '#' or not _HEX_DIGITS.issuperset(v[1:]):
+        raise ValueError("Color must be a hex code like #22D3EE")
+    
+    return v.upper()
 
 
 class CategoryCreate(BaseModel):
     """Create category request"""
     name: str = Field(..., min_length=1, max_length=100, description="Category name")
     kind: Literal["expense", "income", "debt"] = Field(default="expense", description="Category type")
-    color: str = Field(..., pattern=r"^#[0-9A-Fa-f]{6}$", description="Hex color code")
+    color: str = Field(..., description="Hex color code")
     icon: str = Field(..., min_length=1, max_length=50, description="Icon identifier")
     
-    @field_validator('name')
-    @classmethod
-    def validate_name(cls, v: str) -> str:
-        """Validate and sanitize category name"""
-        # Strip whitespace
-        v = v.strip()
-        
-        if not v:
-            raise ValueError("Category name cannot be empty")
-        
-        # Remove multiple consecutive spaces
-        v = re.sub(r'\s+', ' ', v)
-        
-        # Check for potential SQL injection patterns
-        dangerous_patterns = [
-            'drop ', 'delete ', 'insert ', 'update ', 'select ',
-            '--', ';', '/*', '*/', 'xp_', 'sp_', 'exec'
-        ]
-        
-        v_lower = v.lower()
-        for pattern in dangerous_patterns:
-            if pattern in v_lower:
-                raise ValueError(f"Invalid characters in category name: '{pattern}'")
-        
-        # Check for XSS patterns
-        xss_patterns = ['<script', 'javascript:', 'onerror=', 'onclick=']
-        for pattern in xss_patterns:
-            if pattern in v_lower:
-                raise ValueError(f"Invalid characters in category name: '{pattern}'")
-        
-        return v
-    
-    @field_validator('icon')
-    @classmethod
-    def validate_icon(cls, v: str) -> str:
-        """Validate icon name"""
-        # Only allow alphanumeric, dash, and underscore
-        if not re.match(r'^[a-z0-9_-]+$', v.lower()):
-            raise ValueError("Icon name must contain only letters, numbers, dashes, and underscores")
-        
-        return v.lower()
-    
-    @field_validator('color')
-    @classmethod
-    def validate_color(cls, v: str) -> str:
-        """Validate and normalize color"""
-        v = v.upper()
-        
-        # Additional validation: ensure it's not just #000000 or #FFFFFF repeatedly
-        if v == "#000000" or v == "#FFFFFF":
-            # These are valid but maybe warn in logs
-            pass
-        
-        return v
+    _validate_name = field_validator('name')(_validate_category_name)
+    _validate_icon = field_validator('icon')(_validate_category_icon)
+    _validate_color = field_validator('color')(_validate_category_color)
 
 
 class CategoryUpdate(BaseModel):
     """Update category request"""
     name: Optional[str] = Field(None, min_length=1, max_length=100)
     kind: Optional[Literal["expense", "income", "debt"]] = None
-    color: Optional[str] = Field(None, pattern=r"^#[0-9A-Fa-f]{6}$")
+    color: Optional[str] = None
     icon: Optional[str] = Field(None, min_length=1, max_length=50)
     is_active: Optional[bool] = None
     
-    # Reuse validators from CategoryCreate
-    _validate_name = field_validator('name')(CategoryCreate.validate_name.__func__)
-    _validate_icon = field_validator('icon')(CategoryCreate.validate_icon.__func__)
-    _validate_color = field_validator('color')(CategoryCreate.validate_color.__func__)
+    _validate_name = field_validator('name')(_validate_category_name)
+    _validate_icon = field_validator('icon')(_validate_category_icon)
+    _validate_color = field_validator('color')(_validate_category_color)
 
 
 class CategoryOut(BaseModel):
@@ -108,7 +147,19 @@ class CategoryOut(BaseModel):
     icon: str
     is_active: bool
     
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
+    @staticmethod
+    def dump_row(c) -> Dict[str, Any]:
+        """Response dict for a trusted Category row, built without pydantic"""
+        return {
+            "id": c.id,
+            "name": c.name,
+            "kind": c.kind,
+            "color": c.color,
+            "icon": c.icon,
+            "is_active": c.is_active,
+        }
 
 
 class TxCreate(BaseModel):
@@ -130,23 +181,25 @@ class TxCreate(BaseModel):
         v = v.strip()
         
         # Remove control characters but keep newlines and tabs
-        v = ''.join(char for char in v if char.isprintable() or char in ['\n', '\t'])
+        if v.isascii():
+            # Only C0 controls and DEL are non-printable in ASCII; strip them in C
+            v = v.translate(_ASCII_CONTROL_TABLE)
+        else:
+            v = ''.join(char for char in v if char.isprintable() or char in '\n\t')
         
         # Remove multiple consecutive spaces
-        v = re.sub(r' +', ' ', v)
+        v = _SPACES_RE.sub(' ', v)
         
         # Remove multiple consecutive newlines
-        v = re.sub(r'\n{3,}', '\n\n', v)
+        v = _NL_RE.sub('\n\n', v)
         
         # Enforce max length strictly
         v = v[:500]
         
         # Basic XSS prevention
-        xss_patterns = ['<script', 'javascript:', 'onerror=', 'onclick=', 'onload=']
-        v_lower = v.lower()
-        for pattern in xss_patterns:
-            if pattern in v_lower:
-                raise ValueError(f"Invalid content in note: '{pattern}'")
+        m = _NOTE_BLOCKLIST_RE.search(v)
+        if m:
+            raise ValueError(f"Invalid content in note: '{m.group().lower()}'")
         
         return v
     
@@ -157,14 +210,18 @@ class TxCreate(BaseModel):
         if v is None:
             return v
         
-        now = datetime.utcnow()
+        # Normalize to naive UTC so client offsets compare correctly
+        if v.tzinfo is not None:
+            v = v.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
         
         # Don't allow future dates (with 1 day grace period for timezone issues)
-        if v > now + timedelta(days=1):
+        if v > now + _FUTURE_MARGIN:
             raise ValueError("Transaction date cannot be more than 1 day in the future")
         
         # Don't allow very old dates (10 years)
-        if v < now - timedelta(days=365 * 10):
+        if v < now - _PAST_MARGIN:
             raise ValueError("Transaction date cannot be more than 10 years in the past")
         
         return v
@@ -210,7 +267,22 @@ class TxOut(BaseModel):
     occurred_at: datetime
     category_id: Optional[int] = None
     
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(frozen=True, extra="ignore")
+    
+    @staticmethod
+    def dump_row(t) -> Dict[str, Any]:
+        """Response dict for a trusted Transaction row, built without pydantic.
+        
+        The only place epoch-seconds occurred_at becomes a UTC datetime.
+        """
+        return {
+            "id": t.id,
+            "type": t.type,
+            "amount": t.amount,
+            "note": t.note,
+            "occurred_at": datetime.fromtimestamp(t.occurred_at, tz=timezone.utc),
+            "category_id": t.category_id,
+        }
 
 
 class StatsOut(BaseModel):
@@ -221,7 +293,7 @@ class StatsOut(BaseModel):
     month_spent: int = Field(..., description="Amount spent this month")
     month_income: int = Field(..., description="Income this month")
     
-    model_config = ConfigDict(from_attributes=True)
+    model_config = ConfigDict(frozen=True, extra="ignore")
 
 
 # Additional schemas for future features
@@ -254,7 +326,7 @@ class TransactionFilter(BaseModel):
         v = v.strip()
         
         # Remove dangerous characters
-        v = re.sub(r'[<>\'";]', '', v)
+        v = _SEARCH_STRIP_RE.sub('', v)
         
         return v[:100] if v else None
 
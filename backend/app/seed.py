@@ -1,7 +1,8 @@
 """Database seeding for default categories."""
 
+from sqlalchemy import exists, insert
 from sqlmodel import Session, select
-from .models import Category
+from .models import Category, utcnow
 
 DEFAULT_CATEGORIES = [
     ("Coffee & Snacks", "expense", "#22d3ee", "coffee"),
@@ -12,6 +13,12 @@ DEFAULT_CATEGORIES = [
     ("Salary", "income", "#22d3ee", "wallet"),
 ]
 
+# Row dicts for the bulk INSERT, built once at import
+_DEFAULT_CATEGORY_DICTS = tuple(
+    {"name": name, "kind": kind, "color": color, "icon": icon, "is_active": True}
+    for name, kind, color, icon in DEFAULT_CATEGORIES
+)
+
 def ensure_seed(session: Session, user_id: int) -> None:
     """Ensure default categories exist for a user.
     
@@ -22,18 +29,14 @@ def ensure_seed(session: Session, user_id: int) -> None:
         session: Database session
         user_id: User ID to seed categories for
     """
-    existing = session.exec(select(Category).where(Category.user_id == user_id)).first()
-    if existing:
+    has_any = session.exec(select(exists().where(Category.user_id == user_id))).one()
+    if has_any:
         return
-    for name, kind, color, icon in DEFAULT_CATEGORIES:
-        session.add(
-            Category(
-                user_id=user_id,
-                name=name,
-                kind=kind,
-                color=color,
-                icon=icon,
-                is_active=True
-            )
-        )
+    # Core executemany INSERT: no ORM objects or identity-map bookkeeping.
+    # created_at is set here because Core bypasses the model's default_factory.
+    now = utcnow()
+    session.exec(
+        insert(Category),
+        params=[dict(d, user_id=user_id, created_at=now) for d in _DEFAULT_CATEGORY_DICTS],
+    )
     session.commit()
@@ -2,11 +2,23 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
 class Settings(BaseSettings):
+    """Application settings, read from the environment and `.env`.
+
+    `auto_create_tables` makes startup run `SQLModel.metadata.create_all`.
+    It is off by default so that databases whose schema is managed outside the
+    app are not inspected on every boot; the Docker images, `.env.example` and
+    tests turn it on.
+    """
     model_config = SettingsConfigDict(env_file=".env", extra="ignore")
     app_name: str = Field(default="Teacher Budget Buddy Premium", alias="APP_NAME")
     telegram_bot_token: str = Field(alias="TELEGRAM_BOT_TOKEN")
     database_url: str = Field(default="sqlite:///./data/app.db", alias="DATABASE_URL")
     cors_origins: str = Field(default="http://localhost:5173", alias="CORS_ORIGINS")
     log_level: str = Field(default="INFO", alias="LOG_LEVEL")
+    auto_create_tables: bool = Field(default=False, alias="AUTO_CREATE_TABLES")
+    # Connection pool for server databases (ignored for SQLite)
+    db_pool_size: int = Field(default=20, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
+    db_pool_recycle: int = Field(default=3600, alias="DB_POOL_RECYCLE")
 
 settings = Settings()
@@ -10,11 +10,15 @@ import json
 import time
 import urllib.parse
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TelegramUser:
-    """Represents an authenticated Telegram user."""
+    """Represents an authenticated Telegram user.
+    
+    Immutable, since verified users are shared across requests by the cache.
+    """
     id: int
     first_name: str = ""
     last_name: str = ""
@@ -29,62 +33,67 @@ def _parse_init_data(init_data: str) -> Dict[str, str]:
         
     Returns:
         Dictionary of parsed key-value pairs
+        
+    Raises:
+        ValueError: If the string has more fields than initData ever carries
     """
-    return dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True))
+    return dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True, max_num_fields=64))
 
-def verify_init_data(
+@lru_cache(maxsize=4)
+def _secret_key(bot_token: str) -> bytes:
+    """Derive the WebApp HMAC key from the bot token (constant per token)."""
+    return hashlib.sha256(bot_token.encode("utf-8")).digest()
+
+@lru_cache(maxsize=4096)
+def _verify_cached(
     init_data: str,
     bot_token: str,
-    *,
-    max_age_seconds: int = 24 * 60 * 60
-) -> Optional[TelegramUser]:
-    """Verify Telegram WebApp initData and extract user information.
+    max_age_seconds: int,
+) -> Optional[Tuple[TelegramUser, Optional[int]]]:
+    """Check the initData signature and parse the user, memoized per initData.
     
-    This function verifies the HMAC signature of the initData to ensure it
-    came from Telegram and hasn't been tampered with. It also checks that
-    the data is not too old.
+    The HMAC signature covers every field, so a given initData string always
+    yields the same result and can be cached safely. Data that is already
+    stale is rejected before any hashing; that result can be cached too, as
+    it never becomes fresh again. Fresh results still return auth_date so the
+    caller can re-check the age on every cache hit.
     
     Args:
         init_data: Telegram WebApp initData query string
         bot_token: Bot token from BotFather
-        max_age_seconds: Maximum age of initData in seconds (default: 24 hours)
+        max_age_seconds: Maximum age of initData in seconds
         
     Returns:
-        TelegramUser if verification succeeds, None otherwise
+        (TelegramUser, auth_date) if the signature is valid, None otherwise
     """
-    if not init_data:
+    try:
+        data = _parse_init_data(init_data)
+    except ValueError:
         return None
-
-    data = _parse_init_data(init_data)
-    received_hash = data.get("hash")
+    received_hash = data.pop("hash", None)
     if not received_hash:
         return None
 
-    pairs = []
-    for k in sorted(data.keys()):
-        if k == "hash":
-            continue
-        pairs.append(f"{k}={data[k]}")
-    data_check_string = "\n".join(pairs)
+    # Cheap staleness check first, so expired/replayed data skips the crypto
+    auth_date_str = data.get("auth_date")
+    # isdigit() alone accepts Unicode digits like '²' that int() rejects
+    auth_date = int(auth_date_str) if auth_date_str and auth_date_str.isascii() and auth_date_str.isdigit() else None
+    if auth_date is not None and (int(time.time()) - auth_date) > max_age_seconds:
+        return None
+
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(data.items()))
 
-    secret_key = hashlib.sha256(bot_token.encode("utf-8")).digest()
-    computed_hash = hmac.new(secret_key, data_check_string.encode("utf-8"), hashlib.sha256).hexdigest()
+    computed_hash = hmac.new(_secret_key(bot_token), data_check_string.encode("utf-8"), hashlib.sha256).hexdigest()
     if not hmac.compare_digest(computed_hash, received_hash):
         return None
 
-    auth_date_str = data.get("auth_date")
-    if auth_date_str and auth_date_str.isdigit():
-        auth_date = int(auth_date_str)
-        if (int(time.time()) - auth_date) > max_age_seconds:
-            return None
-
     user_json = data.get("user")
     if not user_json:
         return None
 
     try:
         user_obj: Dict[str, Any] = json.loads(user_json)
-        return TelegramUser(
+        user = TelegramUser(
             id=int(user_obj.get("id")),
             first_name=str(user_obj.get("first_name") or ""),
             last_name=str(user_obj.get("last_name") or ""),
@@ -93,3 +102,38 @@ def verify_init_data(
         )
     except Exception:
         return None
+    return user, auth_date
+
+def verify_init_data(
+    init_data: str,
+    bot_token: str,
+    *,
+    max_age_seconds: int = 24 * 60 * 60
+) -> Optional[TelegramUser]:
+    """Verify Telegram WebApp initData and extract user information.
+    
+    This function verifies the HMAC signature of the initData to ensure it
+    came from Telegram and hasn't been tampered with. It also checks that
+    the data is not too old. Signature checks are cached per initData string,
+    since the WebApp resends the same initData for the whole session.
+    
+    Args:
+        init_data: Telegram WebApp initData query string
+        bot_token: Bot token from BotFather
+        max_age_seconds: Maximum age of initData in seconds (default: 24 hours)
+        
+    Returns:
+        TelegramUser if verification succeeds, None otherwise
+    """
+    if not init_data:
+        return None
+
+    verified = _verify_cached(init_data, bot_token, max_age_seconds)
+    if verified is None:
+        return None
+
+    user, auth_date = verified
+    if auth_date is not None and (int(time.time()) - auth_date) > max_age_seconds:
+        return None
+
+    return user
@@ -1,14 +1,66 @@
 from fastapi import APIRouter, Request
+from typing import Optional, Set
+import asyncio
+import logging
 import os
 import httpx
+import orjson
+
+logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and Bot API URLs embed the bot token
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 router = APIRouter()
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+SEND_MESSAGE_URL = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
+_JSON_HEADERS = {"content-type": "application/json"}
+
+# Shared client so replies reuse pooled keep-alive connections to the Bot API;
+# opened and closed by the app lifespan in main.py
+_client: Optional[httpx.AsyncClient] = None
+# Strong references to in-flight replies so they aren't garbage-collected
+_pending: Set[asyncio.Task] = set()
+
+
+async def start_client() -> None:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=10,
+            limits=httpx.Limits(max_keepalive_connections=20),
+        )
+
+
+async def close_client() -> None:
+    global _client
+    if _pending:
+        await asyncio.gather(*_pending, return_exceptions=True)
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def _send_reply(chat_id: int, text: str) -> None:
+    """Post a reply in the background; failures are logged, never raised."""
+    if _client is None:
+        await start_client()
+    try:
+        response = await _client.post(
+            SEND_MESSAGE_URL,
+            content=orjson.dumps({"chat_id": chat_id, "text": text}),
+            headers=_JSON_HEADERS,
+        )
+    except httpx.HTTPError as e:
+        # Never log str(e): httpx includes the request URL, which embeds the bot token
+        logger.warning(f"Failed to send Telegram reply to chat {chat_id}: {type(e).__name__}")
+        return
+    if response.is_error:
+        logger.warning(f"Telegram rejected reply to chat {chat_id}: HTTP {response.status_code}")
 
 
 @router.post("/telegram/webhook")
 async def telegram_webhook(req: Request):
-    update = await req.json()
+    update = orjson.loads(await req.body())
 
     message = update.get("message") or update.get("edited_message")
     if not message or not TOKEN:
@@ -19,10 +71,9 @@ async def telegram_webhook(req: Request):
 
     reply_text = "✅ Bot is online!" if text.startswith("/start") else f"🧾 Got: {text}"
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        await client.post(
-            f"https://api.telegram.org/bot{TOKEN}/sendMessage",
-            json={"chat_id": chat_id, "text": reply_text},
-        )
+    # Acknowledge the update right away; Telegram doesn't wait for the reply
+    task = asyncio.create_task(_send_reply(chat_id, reply_text))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
 
     return {"ok": True}
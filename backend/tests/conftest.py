@@ -11,67 +11,101 @@ import hmac
 import json
 import time
 import os
-import sys
-import pytest
+from functools import lru_cache
+from typing import Dict, Generator
 
-# Rest of your conftest.py stays the same...
+# Set test environment variables BEFORE importing app (settings are read at import)
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test_token_123456:ABCdef")
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+os.environ.setdefault("CORS_ORIGINS", "http://localhost:5173")
+os.environ.setdefault("APP_NAME", "Teacher Budget Buddy Test")
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlmodel import Session, SQLModel, create_engine
-from fastapi.testclient import TestClient
-# ... etc
-from app.settings import settings as app_settings
-from typing import Dict, Generator
-from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 from fastapi.testclient import TestClient
 
-from app.main import app
+from app.settings import settings as app_settings
+from app.main import app, _user_cache, _seeded
 from app.db import get_session
+from app.telegram_auth import _verify_cached
 from app.models import User, Category, Transaction
 
 
-
-# Set test environment variables BEFORE importing app
-os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test_token_123456:ABCdef")
-os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
-os.environ.setdefault("CORS_ORIGINS", "http://localhost:5173")
-os.environ.setdefault("APP_NAME", "Teacher Budget Buddy Test")
-
 # Test database setup
-@pytest.fixture(name="session")
-def session_fixture() -> Generator[Session, None, None]:
+@pytest.fixture(scope="session")
+def engine() -> Engine:
     """
-    Create a fresh test database session for each test.
-    Uses in-memory SQLite for speed.
+    In-memory SQLite engine shared by the whole test run.
+    The schema is created once; tests are isolated by rolling back.
     """
     engine = create_engine(
         "sqlite:///:memory:",
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
     )
+    
+    # pysqlite's own transaction handling breaks SAVEPOINT; let SQLAlchemy
+    # emit BEGIN itself (SQLAlchemy's documented pysqlite recipe)
+    @event.listens_for(engine, "connect")
+    def _disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+    
+    @event.listens_for(engine, "begin")
+    def _emit_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+    
     SQLModel.metadata.create_all(engine)
+    return engine
+
+
+@pytest.fixture(name="session")
+def session_fixture(engine: Engine) -> Generator[Session, None, None]:
+    """
+    Create a test database session for each test.
+    Runs inside an outer transaction that is rolled back afterwards,
+    so commits made by the test or the app never persist. The session
+    works in a SAVEPOINT, so a rollback inside the test only undoes the
+    test's own work, not the fixtures it depends on.
+    """
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    
+    yield session
     
-    with Session(engine) as session:
-        yield session
+    session.close()
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture(scope="session")
+def app_client() -> Generator[TestClient, None, None]:
+    """
+    One TestClient (and one app lifespan) for the whole test run.
+    """
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session) -> TestClient:
+def client_fixture(app_client: TestClient, session: Session) -> Generator[TestClient, None, None]:
     """
-    Create a test client with overridden database session.
+    Return the shared test client with the database session overridden.
     """
     def get_session_override():
         return session
     
     app.dependency_overrides[get_session] = get_session_override
-    client = TestClient(app)
-    yield client
+    yield app_client
     app.dependency_overrides.clear()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def test_bot_token() -> str:
-    """Return a consistent test bot token"""
-    return "123456:ABC-DEF1234ghIkl-zyx57W2v1u123ew11"
+    """Return the bot token the app verifies initData against"""
+    return app_settings.telegram_bot_token
 
 
 @pytest.fixture
@@ -123,6 +157,9 @@ def test_transaction(session: Session, test_user: User, test_category: Category)
     return transaction
 
 
+# Memoized: same arguments -> same signed string for the rest of the run,
+# which stays well inside the 24h initData age limit
+@lru_cache(maxsize=256)
 def create_test_init_data(
     user_id: int,
     first_name: str = "Test",
@@ -161,8 +198,7 @@ def create_test_init_data(
     }
     
     # Create data_check_string
-    pairs = [f"{k}={v}" for k, v in sorted(data.items())]
-    data_check_string = "\n".join(pairs)
+    data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(data.items()))
     
     # Compute hash using bot token
     secret_key = hashlib.sha256(bot_token.encode()).digest()
@@ -177,17 +213,18 @@ def create_test_init_data(
     return "&".join(f"{k}={v}" for k, v in data.items())
 
 
-@pytest.fixture
-def auth_headers() -> Dict[str, str]:
+@pytest.fixture(scope="session")
+def auth_headers(test_bot_token: str) -> Dict[str, str]:
     """
     Generate authentication headers for test requests.
+    Signed once per run; initData stays valid for 24 hours.
     """
     init_data = create_test_init_data(
         user_id=123456,
         first_name="Test",
         last_name="User",
         username="testuser",
-        bot_token=app_settings.telegram_bot_token,  # Use real bot token
+        bot_token=test_bot_token,
     )
     
     return {"X-TG-Init-Data": init_data}
@@ -197,10 +234,11 @@ def auth_headers() -> Dict[str, str]:
 def reset_cache():
     """
     Reset any caches between tests.
-    Add this if you implement caching.
+    Each test gets a fresh database, so cached user ids must not leak.
     """
-    # Example: redis_client.flushdb() if redis is available
-    pass
+    _user_cache.clear()
+    _seeded.clear()
+    _verify_cached.cache_clear()
 
 
 # Helper functions
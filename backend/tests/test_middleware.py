@@ -0,0 +1,73 @@
+"""
+Tests for the rate limiting middleware.
+
+Run tests with: pytest tests/test_middleware.py -v
+"""
+
+import time
+import pytest
+from fastapi.testclient import TestClient
+from starlette.types import Receive, Scope, Send
+
+from app.middleware import RateLimitMiddleware
+
+
+async def ok_app(scope: Scope, receive: Receive, send: Send) -> None:
+    """Trivial ASGI app that always answers 200"""
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+@pytest.fixture
+def limiter() -> RateLimitMiddleware:
+    """Rate limiter allowing 2 calls per 60 seconds"""
+    return RateLimitMiddleware(ok_app, calls=2, period=60)
+
+
+class TestRateLimit:
+    """Tests for RateLimitMiddleware"""
+    
+    def test_rejects_over_limit(self, limiter: RateLimitMiddleware):
+        """Should answer the third request in the window with 429"""
+        client = TestClient(limiter)
+        
+        first = client.get("/api/transactions")
+        assert first.status_code == 200
+        assert first.headers["x-ratelimit-limit"] == "2"
+        assert first.headers["x-ratelimit-remaining"] == "1"
+        
+        second = client.get("/api/transactions")
+        assert second.status_code == 200
+        assert second.headers["x-ratelimit-remaining"] == "0"
+        
+        third = client.get("/api/transactions")
+        assert third.status_code == 429
+        assert third.headers["retry-after"] == "60"
+        assert third.headers["x-ratelimit-limit"] == "2"
+        assert third.headers["x-ratelimit-remaining"] == "0"
+        assert int(third.headers["x-ratelimit-reset"]) >= int(time.time())
+    
+    def test_excluded_paths_not_limited(self, limiter: RateLimitMiddleware):
+        """Should never limit excluded paths"""
+        client = TestClient(limiter)
+        for _ in range(3):
+            assert client.get("/health").status_code == 200
+    
+    def test_cleanup_drops_idle_users(
+        self,
+        limiter: RateLimitMiddleware,
+        monkeypatch: pytest.MonkeyPatch
+    ):
+        """Should forget users idle for more than two periods"""
+        client = TestClient(limiter)
+        client.get("/api/transactions")
+        client.get("/api/transactions", headers={"X-Forwarded-For": "10.0.0.1"})
+        assert len(limiter.requests) == 2
+        
+        later = time.monotonic() + limiter.period * 2 + 1
+        monkeypatch.setattr(time, "monotonic", lambda: later)
+        limiter._cleanup_old_data()
+        
+        assert not limiter.requests
+        assert not limiter._last_seen
+        assert not limiter._expiry_heap
@@ -6,12 +6,15 @@ Copy this to: backend/tests/test_transactions.py
 Run tests with: pytest tests/test_transactions.py -v
 """
 
+import time
 import pytest
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from fastapi.testclient import TestClient
 from sqlmodel import Session
 
+from app.db import migrate_occurred_at_to_epoch
 from app.models import Transaction, User, Category
+from app.telegram_auth import _verify_cached
 from tests.conftest import create_test_init_data, assert_response_ok, assert_valid_transaction
 
 
@@ -53,15 +56,16 @@ class TestTransactionList:
     ):
         """Should respect limit parameter"""
         # Create 10 transactions
-        for i in range(10):
-            tx = Transaction(
+        session.add_all([
+            Transaction(
                 user_id=test_user.id,
                 category_id=test_category.id,
                 type="expense",
                 amount=1000 * (i + 1),
                 note=f"Transaction {i}"
             )
-            session.add(tx)
+            for i in range(10)
+        ])
         session.commit()
         
         # Request only 5
@@ -80,19 +84,20 @@ class TestTransactionList:
         test_category: Category
     ):
         """Should return transactions ordered by date (newest first)"""
-        now = datetime.utcnow()
+        now = int(time.time())
         
         # Create transactions with different dates
-        for i in range(3):
-            tx = Transaction(
+        session.add_all([
+            Transaction(
                 user_id=test_user.id,
                 category_id=test_category.id,
                 type="expense",
                 amount=1000,
                 note=f"Transaction {i}",
-                occurred_at=now - timedelta(days=i)
+                occurred_at=now - i * 86400
             )
-            session.add(tx)
+            for i in range(3)
+        ])
         session.commit()
         
         response = client.get("/api/transactions", headers=auth_headers)
@@ -218,47 +223,14 @@ class TestTransactionCreate:
 class TestTransactionValidation:
     """Tests for transaction input validation"""
     
-    def test_reject_negative_amount(self, client: TestClient, auth_headers: dict):
-        """Should reject negative amounts"""
-        payload = {
-            "type": "expense",
-            "amount": -1000,
-            "note": "Invalid"
-        }
-        
-        response = client.post("/api/transactions", json=payload, headers=auth_headers)
-        assert response.status_code == 422  # Validation error
-    
-    def test_reject_zero_amount(self, client: TestClient, auth_headers: dict):
-        """Should reject zero amounts"""
-        payload = {
-            "type": "expense",
-            "amount": 0,
-            "note": "Invalid"
-        }
-        
-        response = client.post("/api/transactions", json=payload, headers=auth_headers)
-        assert response.status_code == 422
-    
-    def test_reject_invalid_type(self, client: TestClient, auth_headers: dict):
-        """Should reject invalid transaction type"""
-        payload = {
-            "type": "invalid",
-            "amount": 1000,
-            "note": "Invalid type"
-        }
-        
-        response = client.post("/api/transactions", json=payload, headers=auth_headers)
-        assert response.status_code == 422
-    
-    def test_reject_too_large_amount(self, client: TestClient, auth_headers: dict):
-        """Should reject unreasonably large amounts"""
-        payload = {
-            "type": "expense",
-            "amount": 1_000_000_000,  # 1 billion
-            "note": "Too large"
-        }
-        
+    @pytest.mark.parametrize("payload", [
+        pytest.param({"type": "expense", "amount": -1000, "note": "Invalid"}, id="negative_amount"),
+        pytest.param({"type": "expense", "amount": 0, "note": "Invalid"}, id="zero_amount"),
+        pytest.param({"type": "invalid", "amount": 1000, "note": "Invalid type"}, id="invalid_type"),
+        pytest.param({"type": "expense", "amount": 1_000_000_000, "note": "Too large"}, id="too_large_amount"),
+    ])
+    def test_reject_invalid_payload(self, client: TestClient, auth_headers: dict, payload: dict):
+        """Should reject invalid amounts and types with a validation error"""
         response = client.post("/api/transactions", json=payload, headers=auth_headers)
         assert response.status_code == 422
     
@@ -364,6 +336,120 @@ class TestTransactionAuth:
         headers = {"X-TG-Init-Data": "invalid_data"}
         response = client.get("/api/transactions", headers=headers)
         assert response.status_code == 401
+    
+    def test_with_stale_init_data(self, client: TestClient, test_bot_token: str):
+        """Should reject initData older than 24 hours"""
+        init_data = create_test_init_data(
+            user_id=123456,
+            bot_token=test_bot_token,
+            auth_date_offset=-(24 * 60 * 60 + 60),
+        )
+        response = client.get("/api/transactions", headers={"X-TG-Init-Data": init_data})
+        assert response.status_code == 401
+    
+    def test_with_non_ascii_auth_date(self, client: TestClient):
+        """Should reject (not crash on) a Unicode-digit auth_date before the signature check"""
+        headers = {"X-TG-Init-Data": "auth_date=%C2%B2&hash=x"}
+        response = client.get("/api/transactions", headers=headers)
+        assert response.status_code == 401
+    
+    def test_cached_init_data_expires(
+        self,
+        client: TestClient,
+        auth_headers: dict,
+        monkeypatch: pytest.MonkeyPatch
+    ):
+        """Should reject initData that went stale after its signature was cached"""
+        response = client.get("/api/transactions", headers=auth_headers)
+        assert_response_ok(response)
+        
+        later = time.time() + 24 * 60 * 60 + 60
+        monkeypatch.setattr(time, "time", lambda: later)
+        hits = _verify_cached.cache_info().hits
+        response = client.get("/api/transactions", headers=auth_headers)
+        assert response.status_code == 401
+        assert _verify_cached.cache_info().hits == hits + 1
+    
+    def test_with_too_many_fields(self, client: TestClient, auth_headers: dict):
+        """Should reject initData with more fields than Telegram sends"""
+        padding = "&".join(f"f{i}=1" for i in range(64))
+        headers = {"X-TG-Init-Data": auth_headers["X-TG-Init-Data"] + "&" + padding}
+        response = client.get("/api/transactions", headers=headers)
+        assert response.status_code == 401
+
+
+class TestStats:
+    """Tests for GET /api/stats"""
+    
+    def test_stats_windows(
+        self,
+        client: TestClient,
+        auth_headers: dict,
+        session: Session,
+        test_user: User
+    ):
+        """Should split totals into 7-day, 30-day and all-time windows"""
+        now = int(time.time())
+        day = 24 * 60 * 60
+        session.add_all([
+            Transaction(user_id=test_user.id, type=tx_type, amount=amount, occurred_at=now - days_ago * day)
+            for tx_type, amount, days_ago in [
+                ("expense", 100, 1),      # week + month
+                ("expense", 200, 10),     # month only
+                ("expense", 400, 45),     # all-time only
+                ("income", 1000, 2),      # week + month
+                ("income", 2000, 20),     # month only
+                ("income", 4000, 60),     # all-time only
+            ]
+        ])
+        session.commit()
+        
+        response = client.get("/api/stats", headers=auth_headers)
+        assert_response_ok(response)
+        
+        assert response.json() == {
+            "balance": 7000 - 700,
+            "week_spent": 100,
+            "week_income": 1000,
+            "month_spent": 300,
+            "month_income": 3000,
+        }
+
+
+class TestLegacyOccurredAt:
+    """Tests for rows stored before occurred_at became epoch seconds"""
+    
+    def test_text_occurred_at_is_converted(
+        self,
+        client: TestClient,
+        auth_headers: dict,
+        session: Session,
+        test_user: User
+    ):
+        """DATETIME text rows should list and count once migrated"""
+        occurred = (datetime.now(timezone.utc) - timedelta(days=1)).replace(microsecond=0)
+        connection = session.connection()
+        connection.exec_driver_sql(
+            'INSERT INTO "transaction" (user_id, type, amount, note, occurred_at) '
+            "VALUES (?, 'expense', 700, '', ?)",
+            (test_user.id, occurred.strftime("%Y-%m-%d %H:%M:%S.%f")),
+        )
+        
+        migrate_occurred_at_to_epoch(connection)
+        migrate_occurred_at_to_epoch(connection)  # Idempotent
+        
+        response = client.get("/api/transactions", headers=auth_headers)
+        assert_response_ok(response)
+        data = response.json()
+        assert len(data) == 1
+        assert datetime.fromisoformat(data[0]["occurred_at"]) == occurred
+        
+        response = client.get("/api/stats", headers=auth_headers)
+        assert_response_ok(response)
+        stats = response.json()
+        assert stats["balance"] == -700
+        assert stats["week_spent"] == 700
+        assert stats["month_spent"] == 700
 
 
 # Parametrized tests
@@ -1,11 +1,17 @@
 """Telegram bot for Teacher Budget Buddy."""
 
+import html
 import os
+import sys
 import logging
 from datetime import datetime
+from functools import lru_cache
+from typing import Optional
 from telegram import Update
+from telegram.constants import ParseMode
 from telegram.ext import Application, CommandHandler, ContextTypes
-import requests
+from cachetools import TTLCache
+import httpx
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,20 +25,43 @@ logger = logging.getLogger(__name__)
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 API_URL = os.getenv("API_URL", "http://localhost:8000")
 
-def format_money(amount: int) -> str:
-    """Format amount in UZS."""
-    return f"{amount:,} UZS"
+def create_http_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    """Build the backend client; pass `transport` (e.g. httpx.MockTransport) in tests."""
+    return httpx.AsyncClient(
+        base_url=API_URL,
+        timeout=5.0,
+        # httpx drops idle connections after 5s by default; bot commands arrive
+        # sporadically, so keep them around long enough to actually be reused
+        limits=httpx.Limits(
+            max_connections=100,
+            max_keepalive_connections=20,
+            keepalive_expiry=60.0,
+        ),
+        transport=transport,
+    )
 
-async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /start command."""
-    user = update.effective_user
-    
-    welcome_text = f"""
-👋 Welcome to **Teacher Budget Buddy**, {user.first_name}!
+# One pooled client for all handlers, so concurrent commands don't block the
+# event loop and reuse keep-alive connections to the backend. Handlers look it
+# up at call time, so tests can swap in create_http_client(MockTransport(...)).
+HTTP = create_http_client()
+
+# Python 3.11+ parses the API's trailing "Z" natively
+if sys.version_info >= (3, 11):
+    _PARSE = datetime.fromisoformat
+else:
+    def _PARSE(s: str) -> datetime:
+        return datetime.fromisoformat(s[:-1] + "+00:00" if s.endswith("Z") else s)
+
+# user id -> category list; categories rarely change and the bot can't edit them
+CAT_CACHE: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
+# Static replies, built once at import (HTML parse mode)
+WELCOME_TEMPLATE = """
+👋 Welcome to <b>Teacher Budget Buddy</b>, {name}!
 
 I help you track your income and expenses easily.
 
-**Quick Commands:**
+<b>Quick Commands:</b>
 💰 /income 50000 Salary - Add income
 💸 /expense 10000 Coffee - Add expense
 📊 /balance - Check your balance
@@ -40,44 +69,64 @@ I help you track your income and expenses easily.
 📝 /last - Last transactions
 🏷️ /categories - Manage categories
 ❓ /help - Show all commands
-    """
-    
-    await update.message.reply_text(welcome_text, parse_mode='Markdown')
+"""
 
-async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle /help command."""
-    help_text = """
-📚 **Available Commands:**
+HELP_TEXT = """
+📚 <b>Available Commands:</b>
+
+<b>Quick Actions:</b>
+💰 <code>/income &lt;amount&gt; &lt;note&gt;</code> - Add income
+   Example: <code>/income 50000 Salary payment</code>
 
-**Quick Actions:**
-💰 `/income <amount> <note>` - Add income
-   Example: `/income 50000 Salary payment`
+💸 <code>/expense &lt;amount&gt; &lt;note&gt;</code> - Add expense
+   Example: <code>/expense 10000 Coffee and snacks</code>
 
-💸 `/expense <amount> <note>` - Add expense
-   Example: `/expense 10000 Coffee and snacks`
+<b>View Data:</b>
+📊 <code>/balance</code> - Show current balance
+📈 <code>/stats</code> - Weekly and monthly statistics
+📝 <code>/last</code> - Show last 5 transactions
+🏷️ <code>/categories</code> - List all categories
 
-**View Data:**
-📊 `/balance` - Show current balance
-📈 `/stats` - Weekly and monthly statistics
-📝 `/last` - Show last 5 transactions
-🏷️ `/categories` - List all categories
+<b>Other:</b>
+❓ <code>/help</code> - Show this help message
+🔄 <code>/start</code> - Restart bot
+"""
 
-**Other:**
-❓ `/help` - Show this help message
-🔄 `/start` - Restart bot
+@lru_cache(maxsize=10_000)
+def user_headers(user_id: int) -> dict:
+    """Backend auth headers for a Telegram user, built once per user.
+    
+    Passed per request rather than set on the shared client, since concurrent
+    handlers for different users use the same client.
     """
+    return {"X-TG-User-ID": str(user_id)}
+
+@lru_cache(maxsize=4096)
+def format_money(amount: int) -> str:
+    """Format amount in UZS."""
+    return f"{amount:,} UZS"
+
+async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /start command."""
+    user = update.effective_user
     
-    await update.message.reply_text(help_text, parse_mode='Markdown')
+    await update.message.reply_text(
+        WELCOME_TEMPLATE.format(name=html.escape(user.first_name)),
+        parse_mode=ParseMode.HTML,
+    )
+
+async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle /help command."""
+    await update.message.reply_text(HELP_TEXT, parse_mode=ParseMode.HTML)
 
 async def balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /balance command."""
     user = update.effective_user
     
     try:
-        response = requests.get(
-            f"{API_URL}/api/stats",
-            headers={"X-TG-User-ID": str(user.id)},
-            timeout=5
+        response = await HTTP.get(
+            "/api/stats",
+            headers=user_headers(user.id)
         )
         
         if response.status_code == 200:
@@ -113,10 +162,9 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     try:
-        response = requests.get(
-            f"{API_URL}/api/stats",
-            headers={"X-TG-User-ID": str(user.id)},
-            timeout=5
+        response = await HTTP.get(
+            "/api/stats",
+            headers=user_headers(user.id)
         )
         
         if response.status_code == 200:
@@ -154,6 +202,36 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Error fetching stats: {e}")
         await update.message.reply_text("❌ Error connecting to server.")
 
+# Same limits as the backend's TxCreate, checked before the reply
+MAX_AMOUNT = 1_000_000_000
+MAX_NOTE_LENGTH = 500
+
+def transaction_input_error(amount: int, note: str) -> Optional[str]:
+    """Return why the backend would reject this input, or None if it looks valid."""
+    if not 0 < amount < MAX_AMOUNT:
+        return f"❌ Amount must be between 1 and {format_money(MAX_AMOUNT - 1)}."
+    if len(note) > MAX_NOTE_LENGTH:
+        return f"❌ Note is too long (max {MAX_NOTE_LENGTH} characters)."
+    return None
+
+async def post_transaction(update: Update, user_id: int, payload: dict) -> None:
+    """Create a transaction after the user was already told it is being saved.
+    
+    On failure a follow-up message corrects the optimistic reply.
+    """
+    kind = payload["type"]
+    try:
+        response = await HTTP.post("/api/transactions", json=payload, headers=user_headers(user_id))
+        ok = response.status_code in (200, 201)
+    except httpx.HTTPError as e:
+        logger.error(f"Error adding {kind}: {e}")
+        ok = False
+    
+    if not ok:
+        await update.message.reply_text(
+            f"⚠️ Sorry, that {kind} of {format_money(payload['amount'])} was NOT saved. Please try again."
+        )
+
 async def add_income(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /income command."""
     user = update.effective_user
@@ -169,28 +247,29 @@ async def add_income(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         amount = int(context.args[0])
         note = " ".join(context.args[1:]) if len(context.args) > 1 else "Income"
+        error = transaction_input_error(amount, note)
+        if error:
+            await update.message.reply_text(error)
+            return
         
-        response = requests.post(
-            f"{API_URL}/api/transactions",
-            json={
-                "type": "income",
-                "amount": amount,
-                "note": note,
-                "occurred_at": datetime.utcnow().isoformat()
-            },
-            headers={"X-TG-User-ID": str(user.id)},
-            timeout=5
+        payload = {
+            "type": "income",
+            "amount": amount,
+            "note": note,
+            "occurred_at": datetime.utcnow().isoformat()
+        }
+        await update.message.reply_text(
+            f"⏳ Saving income…\n\n"
+            f"💰 Amount: {format_money(amount)}\n"
+            f"📝 Note: {note}\n\n"
+            f"You'll get a message if it can't be saved."
+        )
+        # Scheduled only after the reply is sent, so a fast failure notice
+        # can't arrive before it; the backend write runs in the background
+        context.application.create_task(
+            post_transaction(update, user.id, payload),
+            update=update,
         )
-        
-        if response.status_code in [200, 201]:
-            await update.message.reply_text(
-                f"✅ Income added!\n\n"
-                f"💰 Amount: {format_money(amount)}\n"
-                f"📝 Note: {note}\n\n"
-                f"Use /balance to see your updated balance."
-            )
-        else:
-            await update.message.reply_text("❌ Failed to add income. Please try again.")
     
     except ValueError:
         await update.message.reply_text("❌ Invalid amount. Please use numbers only.")
@@ -213,28 +292,29 @@ async def add_expense(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         amount = int(context.args[0])
         note = " ".join(context.args[1:]) if len(context.args) > 1 else "Expense"
+        error = transaction_input_error(amount, note)
+        if error:
+            await update.message.reply_text(error)
+            return
         
-        response = requests.post(
-            f"{API_URL}/api/transactions",
-            json={
-                "type": "expense",
-                "amount": amount,
-                "note": note,
-                "occurred_at": datetime.utcnow().isoformat()
-            },
-            headers={"X-TG-User-ID": str(user.id)},
-            timeout=5
+        payload = {
+            "type": "expense",
+            "amount": amount,
+            "note": note,
+            "occurred_at": datetime.utcnow().isoformat()
+        }
+        await update.message.reply_text(
+            f"⏳ Saving expense…\n\n"
+            f"💸 Amount: {format_money(amount)}\n"
+            f"📝 Note: {note}\n\n"
+            f"You'll get a message if it can't be saved."
+        )
+        # Scheduled only after the reply is sent, so a fast failure notice
+        # can't arrive before it; the backend write runs in the background
+        context.application.create_task(
+            post_transaction(update, user.id, payload),
+            update=update,
         )
-        
-        if response.status_code in [200, 201]:
-            await update.message.reply_text(
-                f"✅ Expense added!\n\n"
-                f"💸 Amount: {format_money(amount)}\n"
-                f"📝 Note: {note}\n\n"
-                f"Use /balance to see your updated balance."
-            )
-        else:
-            await update.message.reply_text("❌ Failed to add expense. Please try again.")
     
     except ValueError:
         await update.message.reply_text("❌ Invalid amount. Please use numbers only.")
@@ -247,10 +327,9 @@ async def last_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     try:
-        response = requests.get(
-            f"{API_URL}/api/transactions?limit=5",
-            headers={"X-TG-User-ID": str(user.id)},
-            timeout=5
+        response = await HTTP.get(
+            "/api/transactions?limit=5",
+            headers=user_headers(user.id)
         )
         
         if response.status_code == 200:
@@ -260,7 +339,7 @@ async def last_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("📭 No transactions yet. Use /income or /expense to add one!")
                 return
             
-            message = "📝 **Last 5 Transactions:**\n\n"
+            parts = ["📝 **Last 5 Transactions:**\n\n"]
             
             for tx in transactions:
                 tx_type = tx.get("type", "")
@@ -269,19 +348,20 @@ async def last_transactions(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 date = tx.get("occurred_at", "")
                 
                 try:
-                    dt = datetime.fromisoformat(date.replace('Z', '+00:00'))
-                    date_str = dt.strftime("%b %d, %H:%M")
-                except:
+                    date_str = _PARSE(date).strftime("%b %d, %H:%M")
+                except (TypeError, ValueError):
                     date_str = "Unknown date"
                 
                 emoji = "💰" if tx_type == "income" else "💸"
                 sign = "+" if tx_type == "income" else "-"
                 
-                message += f"{emoji} {sign}{format_money(amount)}\n"
-                message += f"   {note}\n"
-                message += f"   🕐 {date_str}\n\n"
+                parts.append(
+                    f"{emoji} {sign}{format_money(amount)}\n"
+                    f"   {note}\n"
+                    f"   🕐 {date_str}\n\n"
+                )
             
-            await update.message.reply_text(message, parse_mode='Markdown')
+            await update.message.reply_text("".join(parts), parse_mode='Markdown')
         else:
             await update.message.reply_text("❌ Could not fetch transactions.")
     
@@ -294,49 +374,59 @@ async def categories(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     
     try:
-        response = requests.get(
-            f"{API_URL}/api/categories",
-            headers={"X-TG-User-ID": str(user.id)},
-            timeout=5
-        )
-        
-        if response.status_code == 200:
-            cats = response.json()
-            
-            if not cats:
-                await update.message.reply_text("📭 No categories yet!")
+        cats = CAT_CACHE.get(user.id)
+        if cats is None:
+            response = await HTTP.get(
+                "/api/categories",
+                headers=user_headers(user.id)
+            )
+            if response.status_code != 200:
+                await update.message.reply_text("❌ Could not fetch categories.")
                 return
-            
-            income_cats = [c for c in cats if c.get("kind") == "income"]
-            expense_cats = [c for c in cats if c.get("kind") == "expense"]
-            
-            message = "🏷️ **Your Categories:**\n\n"
-            
-            if income_cats:
-                message += "💰 **Income:**\n"
-                for cat in income_cats:
-                    message += f"  • {cat.get('name')}\n"
-                message += "\n"
-            
-            if expense_cats:
-                message += "💸 **Expenses:**\n"
-                for cat in expense_cats:
-                    message += f"  • {cat.get('name')}\n"
-            
-            await update.message.reply_text(message, parse_mode='Markdown')
-        else:
-            await update.message.reply_text("❌ Could not fetch categories.")
+            cats = CAT_CACHE[user.id] = response.json()
+        
+        if not cats:
+            await update.message.reply_text("📭 No categories yet!")
+            return
+        
+        # One pass; other kinds (e.g. "debt") are listed in neither section
+        income_cats, expense_cats = [], []
+        for c in cats:
+            kind = c["kind"]
+            if kind == "income":
+                income_cats.append(c)
+            elif kind == "expense":
+                expense_cats.append(c)
+        
+        message = "🏷️ **Your Categories:**\n\n"
+        
+        if income_cats:
+            message += "💰 **Income:**\n"
+            for cat in income_cats:
+                message += f"  • {cat['name']}\n"
+            message += "\n"
+        
+        if expense_cats:
+            message += "💸 **Expenses:**\n"
+            for cat in expense_cats:
+                message += f"  • {cat['name']}\n"
+        
+        await update.message.reply_text(message, parse_mode='Markdown')
     
     except Exception as e:
         logger.error(f"Error fetching categories: {e}")
         await update.message.reply_text("❌ Error connecting to server.")
 
+async def close_http(application: Application) -> None:
+    """Close the shared HTTP client when the bot shuts down."""
+    await HTTP.aclose()
+
 def main():
     """Start the bot."""
     logger.info("Starting bot...")
     logger.info(f"API URL: {API_URL}")
     
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = Application.builder().token(BOT_TOKEN).post_shutdown(close_http).build()
     
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))